@@ -5,24 +5,14 @@ Markdown → Word 桌面版 (customtkinter 现代化 GUI)
 
 import sys
 import os
-import re
-import tempfile
 import threading
-import shutil
 import tkinter.filedialog
 import tkinter.messagebox
 
-import pypandoc
 import customtkinter as ctk
 
-try:
-    from docx import Document
-    from docx.shared import Pt, RGBColor, Inches
-    from docx.oxml.ns import qn
-    from docx.oxml import OxmlElement
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
+# 修复引擎 / 样式处理 / 转换与网页版共用，见 md2word_core.py
+from md2word_core import smart_fix_markdown, convert_to_docx, generate_smart_filename
 
 # ============================================================
 # 捆绑 Pandoc 路径处理
@@ -36,185 +26,6 @@ pandoc_dir = os.path.join(BASE_DIR, 'pandoc')
 os.environ['PATH'] = pandoc_dir + os.pathsep + os.environ.get('PATH', '')
 os.environ['PYPANDOC_PANDOC'] = os.path.join(pandoc_dir, 'pandoc.exe')
 
-# ============================================================
-# 核心功能
-# ============================================================
-
-def smart_fix_markdown(text):
-    log = []
-    fixed_text = text if text is not None else ""
-
-    if '\u200b' in fixed_text:
-        fixed_text = fixed_text.replace('\u200b', '')
-        log.append("🧹 移除了隐形字符")
-
-    if '\\[' in fixed_text or '\\]' in fixed_text:
-        fixed_text = fixed_text.replace('\\[', '$$').replace('\\]', '$$')
-        log.append("📐 LaTeX 块级公式 \\[...\\] → $$...$$")
-
-    if '\\(' in fixed_text or '\\)' in fixed_text:
-        fixed_text = fixed_text.replace('\\(', '$').replace('\\)', '$')
-        log.append("📐 LaTeX 行内公式 \\(...\\) → $...$")
-
-    pattern_space_math = r'(?<!\$)\$[ \t]+(.*?)[ \t]+\$(?!\$)'
-    if re.search(pattern_space_math, fixed_text):
-        new_text, count = re.subn(pattern_space_math, r'$\1$', fixed_text)
-        if count > 0:
-            fixed_text = new_text
-            log.append(f"🔧 移除 {count} 处行内公式多余空格")
-
-    if '<sup>' in fixed_text:
-        new_text, count = re.subn(r'<sup>(.*?)</sup>', r'^\1^', fixed_text)
-        if count > 0:
-            fixed_text = new_text
-            log.append(f"⬆️ 将 {count} 处 HTML 上标转为 Markdown")
-
-    code_fence_count = len(re.findall(r'^```', fixed_text, re.MULTILINE))
-    if code_fence_count % 2 != 0:
-        fixed_text += "\n```"
-        log.append("🧱 自动闭合未结束的代码块")
-
-    math_block_count = fixed_text.count('$$')
-    if math_block_count % 2 != 0:
-        fixed_text += "\n$$"
-        log.append("🧮 自动闭合未结束的公式块")
-
-    fixed_text = re.sub(r'([^\n])\n```', r'\1\n\n```', fixed_text)
-    fixed_text = re.sub(r'```\n([^\n])', r'```\n\n\1', fixed_text)
-
-    lines = fixed_text.splitlines()
-    if len(lines) == 0:
-        return fixed_text, log
-
-    out_lines = []
-    i = 0
-    made_change = False
-    while i < len(lines):
-        line = lines[i]
-        stripped = line.lstrip()
-        if stripped.startswith('>'):
-            if out_lines and out_lines[-1].strip() != '':
-                out_lines.append('')
-                made_change = True
-            while i < len(lines) and lines[i].lstrip().startswith('>'):
-                out_lines.append(lines[i])
-                i += 1
-            if i < len(lines) and lines[i].strip() != '':
-                out_lines.append('')
-                made_change = True
-            continue
-        else:
-            out_lines.append(line)
-            i += 1
-
-    ends_with_newline = fixed_text.endswith('\n')
-    new_fixed = '\n'.join(out_lines)
-    if ends_with_newline:
-        new_fixed = new_fixed + '\n'
-    if made_change:
-        fixed_text = new_fixed
-        log.append("🧩 blockquote 段落前后强制空行")
-
-    return fixed_text, log
-
-
-def apply_word_styles(docx_path):
-    if not HAS_DOCX:
-        return
-    doc = Document(docx_path)
-    styles = doc.styles
-    try:
-        style_name = 'Source Code' if 'Source Code' in styles else 'SourceCode'
-        if style_name in styles:
-            style_code = styles[style_name]
-            style_code.font.name = 'Consolas'
-            style_code.font.size = Pt(10)
-            p_pr = style_code.element.get_or_add_pPr()
-            shd = OxmlElement('w:shd')
-            shd.set(qn('w:val'), 'clear')
-            shd.set(qn('w:color'), 'auto')
-            shd.set(qn('w:fill'), 'F2F2F2')
-            p_pr.append(shd)
-            if not p_pr.find(qn('w:pBdr')):
-                pbdr = OxmlElement('w:pBdr')
-                for border in ['top', 'left', 'bottom', 'right']:
-                    b = OxmlElement(f'w:{border}')
-                    b.set(qn('w:val'), 'single')
-                    b.set(qn('w:sz'), '4')
-                    b.set(qn('w:space'), '1')
-                    b.set(qn('w:color'), 'D4D4D4')
-                    pbdr.append(b)
-                p_pr.append(pbdr)
-    except Exception:
-        pass
-    try:
-        target_styles = ['Block Text', 'Quote', 'BlockText']
-        found_style = None
-        for name in target_styles:
-            if name in styles:
-                found_style = styles[name]
-                break
-        if found_style:
-            found_style.font.color.rgb = RGBColor(105, 105, 105)
-            found_style.font.italic = False
-            found_style.paragraph_format.left_indent = Inches(0.25)
-            p_pr = found_style.element.get_or_add_pPr()
-            if not p_pr.find(qn('w:pBdr')):
-                pbdr = OxmlElement('w:pBdr')
-                left = OxmlElement('w:left')
-                left.set(qn('w:val'), 'single')
-                left.set(qn('w:sz'), '12')
-                left.set(qn('w:space'), '12')
-                left.set(qn('w:color'), '999999')
-                pbdr.append(left)
-                p_pr.append(pbdr)
-    except Exception:
-        pass
-    doc.save(docx_path)
-
-
-def convert_to_docx(md_content):
-    output_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp_file:
-            output_path = tmp_file.name
-        pypandoc.convert_text(
-            md_content, 'docx',
-            format='markdown-yaml_metadata_block+tex_math_dollars',
-            outputfile=output_path,
-            extra_args=['--standalone']
-        )
-        if HAS_DOCX:
-            apply_word_styles(output_path)
-        return output_path, None
-    except Exception as e:
-        if output_path and os.path.exists(output_path):
-            try:
-                os.remove(output_path)
-            except Exception:
-                pass
-        return None, str(e)
-
-
-def generate_smart_filename(text):
-    if not text or not text.strip():
-        return "document.docx"
-    h1_match = re.search(r'^#\s+(.+)$', text, re.MULTILINE)
-    if h1_match:
-        raw_title = h1_match.group(1).strip()
-    else:
-        h2_match = re.search(r'^##\s+(.+)$', text, re.MULTILINE)
-        if h2_match:
-            raw_title = h2_match.group(1).strip()
-        else:
-            lines = [l.strip() for l in text.split('\n') if l.strip()]
-            raw_title = lines[0] if lines else "document"
-    clean_name = re.sub(r'[\\/*?:"<>|]', '', raw_title)
-    clean_name = re.sub(r'[*_`]', '', clean_name)
-    final_name = clean_name[:40].strip()
-    return f"{final_name}.docx"
-
-
 # ============================================================
 DEFAULT_TEXT = r'''# 深度学习中的概率分布
 
@@ -261,7 +72,6 @@ class ModernApp(ctk.CTk):
         y = (sh - 720) // 2
         self.geometry(f"1000x720+{x}+{y}")
 
-        self._temp_docx = None
         self._is_working = False
         self._build_ui()
         self._bind_keys()
@@ -418,12 +228,12 @@ class ModernApp(ctk.CTk):
         def do_work():
             fixed_text, logs = smart_fix_markdown(md_text)
             filename = generate_smart_filename(fixed_text)
-            docx_path, error = convert_to_docx(fixed_text)
-            self.after(0, lambda: self._on_convert_done(docx_path, error, filename, logs))
+            docx_data, error = convert_to_docx(fixed_text)
+            self.after(0, lambda: self._on_convert_done(docx_data, error, filename, logs))
 
         threading.Thread(target=do_work, daemon=True).start()
 
-    def _on_convert_done(self, docx_path, error, filename, logs):
+    def _on_convert_done(self, docx_data, error, filename, logs):
         self._is_working = False
         self.convert_btn.configure(text="🚀 生成并保存 Word 文档", state="normal",
                                     fg_color=("#3b82f6", "#1d4ed8"))
@@ -443,7 +253,8 @@ class ModernApp(ctk.CTk):
 
         if save_path:
             try:
-                shutil.copy2(docx_path, save_path)
+                with open(save_path, 'wb') as f:
+                    f.write(docx_data)
                 self._set_status(f"✅ 已保存：{os.path.basename(save_path)}")
             except Exception as e:
                 self._set_status(f"❌ 保存失败：{e}", is_error=True)
@@ -451,20 +262,6 @@ class ModernApp(ctk.CTk):
         else:
             self._set_status("已取消保存")
 
-        if docx_path and os.path.exists(docx_path):
-            try:
-                os.remove(docx_path)
-            except Exception:
-                pass
-
-    def destroy(self):
-        if self._temp_docx and os.path.exists(self._temp_docx):
-            try:
-                os.remove(self._temp_docx)
-            except Exception:
-                pass
-        super().destroy()
-
 
 def main():
     app = ModernApp()
@@ -7,14 +7,18 @@ a = Analysis(
     binaries=[],
     datas=[
         ('app_gui.py', '.'),
+        ('md2word_core.py', '.'),
         ('pandoc/pandoc.exe', 'pandoc'),
     ],
     hiddenimports=[
+        'md2word_core',
         'pypandoc',
         'docx',
         'docx.shared',
         'docx.oxml',
         'docx.oxml.ns',
+        'docx.opc.oxml',
+        'docx.styles.styles',
         'customtkinter',
         'tkinter',
         'tkinter.ttk',
@@ -0,0 +1,407 @@
+# md2word_core.py — 修复引擎 / Word 样式处理 / 转换，网页版 (app.py) 与桌面版 (app_gui.py) 共用
+# 只依赖 pypandoc 与 python-docx，不引入任何界面库；缓存统一用 lru_cache（模块只导入一次，跨重跑保留）
+import os
+import io
+import re
+import sys
+import subprocess
+import atexit
+import tempfile
+import threading
+import contextlib
+import zipfile
+from copy import deepcopy
+from functools import lru_cache
+
+import pypandoc
+
+# 尝试导入 python-docx，用于后期处理 Word 样式
+try:
+    from docx.shared import Pt, RGBColor, Inches
+    from docx.oxml.ns import qn, nsdecls
+    from docx.oxml import parse_xml
+    from docx.opc.oxml import serialize_part_xml
+    from docx.styles.styles import Styles
+    HAS_DOCX = True
+except ImportError:
+    HAS_DOCX = False
+
+# 样式注入用的 OOXML 片段与输入无关：导入时构建一次，使用时 deepcopy
+if HAS_DOCX:
+    _CODE_SHD = parse_xml(f'<w:shd {nsdecls("w")} w:val="clear" w:color="auto" w:fill="F2F2F2"/>')
+    _CODE_PBDR = parse_xml(
+        f'<w:pBdr {nsdecls("w")}>'
+        + ''.join(f'<w:{border} w:val="single" w:sz="4" w:space="1" w:color="D4D4D4"/>'
+                  for border in ('top', 'left', 'bottom', 'right'))
+        + '</w:pBdr>'
+    )
+    _QUOTE_PBDR = parse_xml(
+        f'<w:pBdr {nsdecls("w")}><w:left w:val="single" w:sz="12" w:space="12" w:color="999999"/></w:pBdr>'
+    )
+
+# 预编译修复引擎用到的正则（预览区每次输入都会触发重跑，避免重复编译/查缓存）
+_RE_LATEX_DELIM = re.compile(r'\\([\[\]()])')
+# 公式内容只允许非 $ 字符或转义字符，且首尾必须是非空白字符：内容与两侧的 [ \t]+ 不再重叠，
+# 否则 $ 后跟一长串空格时，空格在三段之间的切分方式是立方级的，表格里对齐用的空格就会卡住预览
+_RE_SPACE_MATH = re.compile(
+    r'(?<!\$)\$[ \t]+'
+    r'((?:[^ \t$\n\\]|\\.)(?:(?:[^$\n\\]|\\.)*?(?:[^ \t$\n\\]|\\.))?)'
+    r'[ \t]+\$(?!\$)'
+)
+# 行内 HTML 标签 -> Pandoc 语法：正则只找出开 / 闭标签，配对由一次扫描中的栈完成
+# （<br> 不做转换：Pandoc 的硬换行写法放进表格单元格会把表格行拆散）
+_RE_HTML_TAG = re.compile(r'<(/?)(sup|sub|u)>')
+_HTML_INLINE_MARKS = {'sup': ('^', '^'), 'sub': ('~', '~'), 'u': ('[', ']{.underline}')}
+# 围栏代码块（未闭合时到文末）与同一行内的反引号代码：其中的 HTML 是代码示例，不做转换
+_RE_CODE_SEGMENT = re.compile(
+    r'^```.*?(?:^```[^\n]*$|\Z)|(?<!`)(`+)(?!`)[^\n]*?(?<!`)\1(?!`)',
+    re.MULTILINE | re.DOTALL,
+)
+# 代码块前后补空行：两条规则合并为一个交替模式；零宽断言不消耗字符，相邻的围栏行也能各自补齐
+_RE_FENCE_PAD = re.compile(r'(?<=[^\n])\n(?=```)|(?<=```)\n(?=[^\n])')
+# blockquote 边界：引用行后紧跟非空普通行，或非空普通行后紧跟引用行（匹配前一行，后一行只做前瞻）
+_RE_QUOTE_GAP = re.compile(
+    r'^(?:[^\S\n]*>[^\n]*\n(?=[^\S\n]*[^\s>])|[^\S\n]*[^\s>][^\n]*\n(?=[^\S\n]*>))',
+    re.MULTILINE,
+)
+
+# 智能文件名：一级 / 二级标题，以及文件名中需要剔除的字符（非法字符 + Markdown 标记符）
+_RE_H1 = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+_RE_H2 = re.compile(r'^##\s+(.+)$', re.MULTILINE)
+# 第一个非空行：从第一个非空白字符取到行尾
+_RE_FIRST_LINE = re.compile(r'\S[^\n]*')
+# 标题几乎总在文档开头：只在前 8 KB 内找标题，找不到时再扫全文
+_FILENAME_SCAN_LIMIT = 8192
+_FILENAME_BAD_TRANS = str.maketrans('', '', '\\/*?:"<>|_`~^')
+# 行内 HTML 转换产生的下划线写法 [文字]{.underline}，文件名里只保留文字
+_RE_UNDERLINE_SPAN = re.compile(r'\[([^\]\n]*)\]\{\.underline\}')
+
+# LLM 输出中常见的隐形字符：零宽空格 / 零宽非连接符 / 零宽连接符 / BOM
+_INVISIBLE_CHARS = ('\u200b', '\u200c', '\u200d', '\ufeff')
+_INVISIBLE_TRANS = str.maketrans(dict.fromkeys(_INVISIBLE_CHARS))
+# LaTeX 定界符 -> Pandoc 美元符号语法
+_LATEX_DELIM_MAP = {'[': '$$', ']': '$$', '(': '$', ')': '$'}
+
+# --- 1. 智能修复引擎 (V5.1 增强版) ---
+def _latex_delim_repl(m):
+    return _LATEX_DELIM_MAP[m.group(1)]
+
+def _convert_html_inline(segment, tag_counts):
+    # 单次扫描：开标签入栈，遇到与栈顶同名的闭标签即转换，嵌套标签由内向外一并完成，不必逐层重扫全文。
+    # 标签不跨行；标签交错或出现多余的闭标签时，此前未闭合的标签一律保持原样。
+    # 以下标签对也保持原样（Pandoc 会丢弃这些 HTML 标签、保留文字）：
+    #   * 空标签对：删掉会让前后文字拼在一起，可能凭空拼出 ``` 或 > 等块级标记
+    #   * 内容含空格的上标 / 下标：Pandoc 的 ^...^ / ~...~ 内不能有空格，否则波浪线等会原样留在文档里
+    pieces = []
+    stack = []  # [标签名, 开标签在 pieces 中的位置, 内容是否含空白]
+    pos = 0
+    for m in _RE_HTML_TAG.finditer(segment):
+        between = segment[pos:m.start()]
+        if between:
+            if stack:
+                if '\n' in between:
+                    stack.clear()
+                elif ' ' in between or '\t' in between:
+                    stack[-1][2] = True
+            pieces.append(between)
+        pos = m.end()
+        is_closing, tag = m.groups()
+        if not is_closing:
+            stack.append([tag, len(pieces), False])
+            pieces.append(m.group())
+        elif stack and stack[-1][0] == tag:
+            _, index, has_blank = stack.pop()
+            # 外层标签的内容包含这一对的内容
+            if has_blank and stack:
+                stack[-1][2] = True
+            if index == len(pieces) - 1 or (has_blank and tag != 'u'):
+                pieces.append(m.group())
+            else:
+                tag_counts[tag] = tag_counts.get(tag, 0) + 1
+                opening, closing = _HTML_INLINE_MARKS[tag]
+                pieces[index] = opening
+                pieces.append(closing)
+        else:
+            stack.clear()
+            pieces.append(m.group())
+    pieces.append(segment[pos:])
+    return ''.join(pieces)
+
+def _outside_code(text, func):
+    # 只对代码块 / 行内代码以外的片段调用 func，代码部分原样拼回
+    pieces = []
+    pos = 0
+    for m in _RE_CODE_SEGMENT.finditer(text):
+        pieces.append(func(text[pos:m.start()]))
+        pieces.append(m.group())
+        pos = m.end()
+    pieces.append(func(text[pos:]))
+    return ''.join(pieces)
+
+def smart_fix_markdown(text, pandoc_html=True):
+    """
+    pandoc_html=False 时保留行内 HTML 标签（网页预览可直接渲染），日志照常报告转换情况，供生成 Word 前预览使用。
+
+    注意：此函数只在原有逻辑上增加了
+    — 对 blockquote(以 '>' 开头的连续行块) 的严格处理：
+      * 在整个 blockquote 块之前确保有至少 1 个空行
+      * 在整个 blockquote 块之后确保有至少 1 个空行
+    不会对 blockquote 行本身做任何修改（不会删除或添加 '>'），也不会对其它结构进行不必要改动。
+    """
+    log = []
+    fixed_text = text if text is not None else ""
+
+    # 各规则先用 in 做廉价的子串探测，文本里不可能命中时直接跳过正则扫描
+    # 1. [基础] 清理零宽空格等隐形字符（translate 对非 ASCII 文本是逐字符查表，先用 in 探测再执行）
+    if any(ch in fixed_text for ch in _INVISIBLE_CHARS):
+        fixed_text = fixed_text.translate(_INVISIBLE_TRANS)
+        log.append("🧹 移除了隐形字符")
+
+    # 2. [关键] 强制标准化 LaTeX 公式语法（一次正则扫描同时处理四种定界符）
+    # 块级公式 \[ ... \] -> $$...$$，行内公式 \( ... \) -> $...$
+    # 每处 \[ \] \( \) 都会被替换，按子串即可判断出现过哪类定界符，替换函数不必记录状态
+    if '\\' in fixed_text:
+        has_block = '\\[' in fixed_text or '\\]' in fixed_text
+        has_inline = '\\(' in fixed_text or '\\)' in fixed_text
+        if has_block or has_inline:
+            fixed_text = _RE_LATEX_DELIM.sub(_latex_delim_repl, fixed_text)
+        if has_block:
+            log.append("📐 将 LaTeX 块级公式 \\[...\\] 标准化为 $$...$$")
+        if has_inline:
+            log.append("📐 将 LaTeX 行内公式 \\(...\\) 标准化为 $...$")
+
+    # 3. [新增] 修复行内公式多余空格 $x$ -> $x$
+    if '$' in fixed_text:
+        fixed_text, count = _RE_SPACE_MATH.subn(r'$\1$', fixed_text)
+        if count > 0:
+            log.append(f"🔧 移除了 {count} 处行内公式的多余空格 ($x$ -> $x$)")
+
+    # 4. [HTML 清理] 行内 HTML 标签转换为 Pandoc 语法（单次扫描，按标签分别计数）
+    # <sup> -> ^...^，<sub> -> ~...~，<u> -> [...]{.underline}
+    # 代码块与行内代码中的标签是代码示例，保持原样
+    if '</' in fixed_text:
+        tag_counts = {}
+
+        def convert_segment(segment):
+            if '</' not in segment:
+                return segment
+            return _convert_html_inline(segment, tag_counts)
+
+        converted_text = _outside_code(fixed_text, convert_segment)
+        if pandoc_html:
+            fixed_text = converted_text
+        if 'sup' in tag_counts:
+            log.append(f"⬆️ 将 {tag_counts['sup']} 处 HTML 上标标签转换为 Markdown 格式")
+        if 'sub' in tag_counts:
+            log.append(f"⬇️ 将 {tag_counts['sub']} 处 HTML 下标标签转换为 Markdown 格式")
+        if 'u' in tag_counts:
+            log.append(f"🔤 将 {tag_counts['u']} 处 HTML 下划线标签转换为 Markdown 格式")
+
+    # 5. [闭合检查] 自动闭合代码块（文中没有 ``` 时连同第 7 步一起跳过）
+    # 行首围栏数 = 换行后紧跟 ``` 的次数 + 文首围栏，str.count 不必构建匹配列表
+    has_fence = '```' in fixed_text
+    if has_fence and (fixed_text.count('\n```') + fixed_text.startswith('```')) % 2 != 0:
+        fixed_text += "\n```"
+        log.append("🧱 自动闭合了未结束的代码块")
+
+    # 6. [闭合检查] 自动闭合公式块
+    math_block_count = fixed_text.count('$$')
+    if math_block_count % 2 != 0:
+        fixed_text += "\n$$"
+        log.append("🧮 自动闭合了未结束的 LaTeX 公式块")
+
+    # 7. [格式优化] 确保代码块前后有空行
+    if has_fence:
+        fixed_text = _RE_FENCE_PAD.sub('\n\n', fixed_text)
+
+    # ---------------------------
+    # 8. [保守新增] 对 blockquote（以 '>' 开头的连续行）进行段级分隔：
+    #    - 将连续以 '>' 开头的行视为一个 blockquote 块（保留每行的 '>'）
+    #    - 在该块之前确保至少有一个空行；在该块之后确保至少有一个空行
+    #    - 不改变块内行内容，不添加或删除 '>' 符号
+    #    该处理只在“引用行 / 非空普通行”的交界处补一个换行，由单个正则一次完成，避免误匹配其它结构。
+    # ---------------------------
+    if '>' in fixed_text:
+        fixed_text, count = _RE_QUOTE_GAP.subn(r'\g<0>\n', fixed_text)
+        if count > 0:
+            log.append("🧩 已在所有 blockquote 段落的前后强制加入空行（便于 Pandoc 解析）")
+
+    return fixed_text, log
+
+# --- 2. Word 样式后处理 ---
+# 样式只存在于 word/styles.xml。同一个 Pandoc 模板每次生成的 styles.xml 完全相同，
+# 按原始内容缓存修改后的结果：重复转换时直接复用，跳过解析、样式修改与序列化
+@lru_cache(maxsize=4)
+def _style_styles_xml(styles_xml):
+    styles_element = parse_xml(styles_xml)
+    styles = Styles(styles_element)
+
+    # === 1. 优化代码块样式 (Source Code) ===
+    try:
+        style_name = 'Source Code' if 'Source Code' in styles else 'SourceCode'
+        if style_name in styles:
+            style_code = styles[style_name]
+            style_code.font.name = 'Consolas'
+            style_code.font.size = Pt(10)
+            
+            p_pr = style_code.element.get_or_add_pPr()
+            if p_pr.find(qn('w:shd')) is None:
+                p_pr.append(deepcopy(_CODE_SHD))
+            
+            if p_pr.find(qn('w:pBdr')) is None:
+                p_pr.append(deepcopy(_CODE_PBDR))
+            
+    except Exception as e:
+        print(f"代码块样式应用失败: {e}")
+
+    # === 2. 优化引用块样式 (Block Text) ===
+    try:
+        target_styles = ['Block Text', 'Quote', 'BlockText']
+        found_style = None
+        for name in target_styles:
+            if name in styles:
+                found_style = styles[name]
+                break
+        
+        if found_style:
+            found_style.font.color.rgb = RGBColor(105, 105, 105) 
+            found_style.font.italic = False
+            found_style.paragraph_format.left_indent = Inches(0.25)
+            
+            p_pr = found_style.element.get_or_add_pPr()
+            if p_pr.find(qn('w:pBdr')) is None:
+                p_pr.append(deepcopy(_QUOTE_PBDR))
+
+    except Exception as e:
+        print(f"引用样式应用失败: {e}")
+
+    return serialize_part_xml(styles_element)
+
+def apply_word_styles(docx_path, output=None):
+    # docx_path / output 可以是路径，也可以是 BytesIO 等文件对象；output 为空时写回原文件
+    # 只替换 word/styles.xml 这一个部件，不构建整份 Document，其余部件原样写回
+    if not HAS_DOCX:
+        return 
+
+    with zipfile.ZipFile(docx_path) as src:
+        parts = [(info, src.read(info)) for info in src.infolist()]
+
+    for index, (info, blob) in enumerate(parts):
+        if info.filename == 'word/styles.xml':
+            parts[index] = (info, _style_styles_xml(blob))
+            break
+
+    with zipfile.ZipFile(docx_path if output is None else output, 'w') as dst:
+        for info, blob in parts:
+            dst.writestr(info, blob)
+
+# --- 3. 转换 ---
+# Windows 下启动 Pandoc 时不弹出控制台窗口（与 pypandoc 的做法一致）
+_CREATE_NO_WINDOW = 0x08000000 if sys.platform == 'win32' else 0
+
+def _run_pandoc(md_content, input_format, extra_args):
+    # 直接调用 Pandoc：pypandoc.convert_text 每次转换前还会额外启动两次 Pandoc 查询输入/输出格式列表。
+    # Pandoc 路径仍由 pypandoc 查找并在进程内缓存（桌面版通过 PYPANDOC_PANDOC 指定内置的 Pandoc）
+    # docx 写到标准输出，直接以字节返回，不经过临时文件
+    args = [pypandoc.get_pandoc_path(), f'--from={input_format}', '--to=docx', '--output=-']
+    result = subprocess.run(
+        args + extra_args,
+        input=md_content.encode('utf-8'),
+        capture_output=True,
+        creationflags=_CREATE_NO_WINDOW,
+    )
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='replace')
+        raise RuntimeError(f'Pandoc died with exitcode "{result.returncode}" during conversion: {stderr}')
+    return result.stdout
+
+def _remove_reference_doc(path):
+    # 退出时清理参考文档：文件可能已被系统清理（也正是触发重建的原因），不存在时忽略
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+# 首次构建与重建都在锁内完成：Streamlit 多个会话或桌面版工作线程同时首次转换时只生成一份参考文档
+_REFERENCE_LOCK = threading.Lock()
+
+# 样式参考文档：用 Pandoc 转换一份含代码块与引用块的最小文档，注入样式后作为 --reference-doc。
+# 之后每次转换由 Pandoc 直接写出带样式的 docx，不再逐次解压、修改样式、重新打包。
+# 构建失败（或未安装 python-docx）时返回 None，转换时退回到逐次后处理
+@lru_cache(maxsize=1)
+def _styled_reference_doc():
+    if not HAS_DOCX:
+        return None
+
+    reference_path = None
+    try:
+        reference_data = _run_pandoc("```\ncode\n```\n\n> quote\n", 'markdown', ['--standalone'])
+        # --reference-doc 只接受文件路径：样式处理后的结果直接写入临时文件
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp_file:
+            reference_path = tmp_file.name
+            apply_word_styles(io.BytesIO(reference_data), tmp_file)
+        atexit.register(_remove_reference_doc, reference_path)
+        return reference_path
+    except Exception as e:
+        print(f"样式参考文档生成失败，改为逐次处理样式: {e}")
+        if reference_path and os.path.exists(reference_path):
+            try:
+                os.remove(reference_path)
+            except:
+                pass
+        return None
+
+def convert_to_docx(md_content):
+    # 返回 (docx 字节, 错误信息)。全程在内存中完成，不写临时文件
+    try:
+        with _REFERENCE_LOCK:
+            reference_doc = _styled_reference_doc()
+            if reference_doc and not os.path.exists(reference_doc):
+                # 参考文档被系统清理掉时重新生成，并撤销旧路径的退出清理，避免重建一次多登记一个
+                atexit.unregister(_remove_reference_doc)
+                _styled_reference_doc.cache_clear()
+                reference_doc = _styled_reference_doc()
+
+        extra_args = ['--standalone']
+        if reference_doc:
+            extra_args.append(f'--reference-doc={reference_doc}')
+        
+        docx_data = _run_pandoc(
+            md_content,
+            'markdown-yaml_metadata_block+tex_math_dollars', # 重点：减号表示禁用
+            extra_args
+        )
+        
+        # 没有参考文档时才需要后处理：样式处理同样在内存中完成
+        if HAS_DOCX and not reference_doc:
+            buffer = io.BytesIO()
+            apply_word_styles(io.BytesIO(docx_data), buffer)
+            return buffer.getvalue(), None
+
+        return docx_data, None
+    except Exception as e:
+        return None, str(e)
+
+# --- 4. 智能文件名生成 ---
+def generate_smart_filename(text):
+    # 第一个非空行：找到即停，不切分也不复制整份文本；找不到说明全是空白
+    first_line = _RE_FIRST_LINE.search(text) if text else None
+    if first_line is None:
+        return "document.docx"
+    
+    # 截到最后一个完整行，避免把被截断的标题当作结果
+    head = text[:_FILENAME_SCAN_LIMIT]
+    if len(text) > _FILENAME_SCAN_LIMIT:
+        head = head[:head.rfind('\n') + 1]
+
+    title_match = _RE_H1.search(head) or _RE_H2.search(head)
+    if title_match is None and len(head) < len(text):
+        title_match = _RE_H1.search(text) or _RE_H2.search(text)
+
+    if title_match:
+        raw_title = title_match.group(1).strip()
+    else:
+        raw_title = first_line.group().strip()
+
+    clean_name = _RE_UNDERLINE_SPAN.sub(r'\1', raw_title).translate(_FILENAME_BAD_TRANS)
+    final_name = clean_name[:40].strip()
+    
+    return f"{final_name}.docx"
@@ -0,0 +1,110 @@
+# md2word_core 的回归测试：只测修复引擎与文件名，不调用 Pandoc
+# 运行：python -m unittest（在项目根目录）
+import time
+import unittest
+
+from md2word_core import smart_fix_markdown, generate_smart_filename
+
+# 退化输入的耗时上限（秒）：修复后都在毫秒以内，留足余量避免机器抖动误报
+_TIME_LIMIT = 0.2
+
+
+def _elapsed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+class SpaceMathTest(unittest.TestCase):
+    def test_strips_spaces_inside_inline_math(self):
+        self.assertEqual(smart_fix_markdown('$ x_0 = 0 $')[0], '$x_0 = 0$')
+        self.assertEqual(smart_fix_markdown('$\tE=mc^2 \t$')[0], '$E=mc^2$')
+
+    def test_keeps_escaped_and_display_math(self):
+        self.assertEqual(smart_fix_markdown('$ a\\ $')[0], '$ a\\ $')
+        self.assertEqual(smart_fix_markdown('$$ x $$')[0], '$$ x $$')
+
+    def test_blank_body_is_not_collapsed_into_display_math(self):
+        self.assertEqual(smart_fix_markdown('$  $')[0], '$  $')
+        self.assertEqual(smart_fix_markdown('$\t\t$')[0], '$\t\t$')
+
+    def test_long_whitespace_runs_after_dollar_are_linear(self):
+        cases = [
+            '$' + ' ' * 1000 + 'a',
+            '$' + ' ' * 2000,
+            '| $ ' + ' ' * 1000 + '|',
+            ('| $ ' + ' ' * 1000 + '|\n') * 20,
+        ]
+        for text in cases:
+            with self.subTest(length=len(text)):
+                self.assertLess(_elapsed(smart_fix_markdown, text), _TIME_LIMIT)
+
+
+def _fixed(text, **kwargs):
+    return smart_fix_markdown(text, **kwargs)[0]
+
+
+class HtmlInlineTest(unittest.TestCase):
+    def test_converts_simple_pairs(self):
+        self.assertEqual(_fixed('H<sub>2</sub>O x<sup>2</sup> <u>note</u>'), 'H~2~O x^2^ [note]{.underline}')
+
+    def test_nested_pairs_convert_from_the_inside_out(self):
+        self.assertEqual(_fixed('x <sub><sup>2</sup></sub>'), 'x ~^2^~')
+        self.assertEqual(_fixed('<u>x<u>y</u>z</u>'), '[x[y]{.underline}z]{.underline}')
+        self.assertEqual(_fixed('<u><sup>x</sup><sub>y</sub></u>'), '[^x^~y~]{.underline}')
+
+    def test_interleaved_pairs_stay_raw(self):
+        self.assertEqual(_fixed('<sup>a<sub>b</sup>c</sub>'), '<sup>a<sub>b</sup>c</sub>')
+        self.assertEqual(_fixed('<u><sup>x</u></sup>'), '<u><sup>x</u></sup>')
+
+    def test_stray_closing_tags(self):
+        self.assertEqual(_fixed('</sub><u>a</u>'), '</sub>[a]{.underline}')
+        self.assertEqual(_fixed('<u>a</sub>b</u>'), '<u>a</sub>b</u>')
+        self.assertEqual(_fixed('<sub><u>a</u>'), '<sub>[a]{.underline}')
+
+    def test_pairs_do_not_span_lines(self):
+        self.assertEqual(_fixed('<u>a\nb</u>'), '<u>a\nb</u>')
+
+    def test_blank_or_empty_content_stays_raw(self):
+        self.assertEqual(_fixed('x<sub>i j</sub>'), 'x<sub>i j</sub>')
+        self.assertEqual(_fixed('<sup>a <sub>b</sub></sup>'), '<sup>a ~b~</sup>')
+        self.assertEqual(_fixed('<u>a b</u>'), '[a b]{.underline}')
+        self.assertEqual(_fixed('<u></u>> q'), '<u></u>> q')
+
+    def test_code_blocks_and_spans_are_left_alone(self):
+        block = '```html\n<p>H<sub>2</sub>O <u>note</u></p>\n```\n'
+        self.assertIn('<p>H<sub>2</sub>O <u>note</u></p>', _fixed(block))
+        self.assertEqual(_fixed('`<u>x</u>` and <u>y</u>'), '`<u>x</u>` and [y]{.underline}')
+        self.assertEqual(_fixed('``a`<sup>b</sup>`` <sup>c</sup>'), '``a`<sup>b</sup>`` ^c^')
+        self.assertIn('<u>a</u>', _fixed('```\n<u>a</u>'))
+
+    def test_preview_mode_keeps_tags_but_reports_them(self):
+        text, log = smart_fix_markdown('H<sub>2</sub>O', pandoc_html=False)
+        self.assertEqual(text, 'H<sub>2</sub>O')
+        self.assertEqual(len(log), 1)
+
+    def test_degenerate_tag_input_is_linear(self):
+        cases = [
+            '<sup>' * 4000 + 'x' + '</sup>' * 4000,
+            '<sup>' * 200000 + 'x',
+            '<u>a</sup>' * 50000,
+        ]
+        for text in cases:
+            with self.subTest(length=len(text)):
+                self.assertLess(_elapsed(smart_fix_markdown, text), _TIME_LIMIT)
+        self.assertEqual(_fixed(cases[0]), '^' * 4000 + 'x' + '^' * 4000)
+
+
+class FilenameTest(unittest.TestCase):
+    def test_pandoc_markup_is_stripped(self):
+        text = _fixed('# Hello <sub>2</sub> <u>x</u>\n')
+        self.assertEqual(generate_smart_filename(text), 'Hello 2 x.docx')
+
+    def test_h1_wins_over_h2_and_falls_back_to_first_line(self):
+        self.assertEqual(generate_smart_filename('## Sub\n# Title\n'), 'Title.docx')
+        self.assertEqual(generate_smart_filename('\n  plain line\nmore'), 'plain line.docx')
+        self.assertEqual(generate_smart_filename(' \n\t'), 'document.docx')
+
+
+if __name__ == '__main__':
+    unittest.main()